@@ -1,37 +1,110 @@
-from flask import Flask, request, send_file, render_template
+from flask import Flask, request, send_file, render_template, jsonify, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import sqlite3
+import time
+import uuid
+from urllib.request import pathname2url
 from datetime import datetime, timedelta
 import random
+from itertools import cycle
 import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import atexit
+
+# Set up logging. The log file is written by a QueueListener thread so a
+# migration never waits on file I/O.
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, logging.FileHandler('database_migration.log'))
+log_listener.start()
+atexit.register(log_listener.stop)
 
-# Set up logging
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('database_migration.log'),
+        QueueHandler(log_queue),
         logging.StreamHandler()
     ]
 )
 
 app = Flask(__name__)
 
+# Number of rows read from the old database per fetchmany() call
+BATCH_SIZE = 5000
+
 # Get the absolute path to the directory containing this script
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 # Configure the SQLAlchemy database URI
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "new_database.db")}'
 app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'uploads')
+app.config['RESULT_FOLDER'] = os.path.join(basedir, 'results')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max-limit
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024  # 1MB chunks when saving uploads
+
+# Let nginx/Apache serve downloads with sendfile(2) when deployed behind one
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'connect_args': {'check_same_thread': False, 'timeout': 30},
+    # Sized for the WSGI server's worker threads
+    'pool_size': 10,
+    'max_overflow': 20,
+}
 
 db = SQLAlchemy(app)
 
-# Ensure the upload folder exists
+# Migrations run in the background so uploads return immediately. Every
+# migration rewrites the same database, so a single worker runs them one at a
+# time. jobs maps a job id to the Future of its migration and the time it
+# finished; finished jobs and their result files are kept for RESULT_TTL
+# seconds so the download can be retried or resumed, then expired.
+migration_executor = ThreadPoolExecutor(max_workers=1)
+jobs = {}
+RESULT_TTL = 60 * 60
+
+# PRAGMAs applied to every SQLite connection. WAL with synchronous=NORMAL avoids
+# an fsync per statement during bulk inserts; the rest keep scratch data and hot
+# pages in memory.
+SQLITE_READ_PRAGMAS = (
+    'temp_store=MEMORY',
+    'cache_size=-64000',
+    'mmap_size=268435456',
+)
+SQLITE_WRITE_PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+) + SQLITE_READ_PRAGMAS
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite_connection(dbapi_connection, connection_record):
+    # The listener sees every engine in the process; only SQLite understands these
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    apply_pragmas(dbapi_connection, SQLITE_WRITE_PRAGMAS)
+    # Fallback used by date_expression() for dates SQLite cannot parse itself
+    dbapi_connection.create_function('normalize_date', 1, normalize_date, deterministic=True)
+
+
+# Ensure the upload and result folders exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['RESULT_FOLDER'], exist_ok=True)
 
 
 # Model definitions
@@ -85,6 +158,7 @@ class HoursLog(db.Model):
     item_id = db.Column(db.Integer, nullable=False)
     hours = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False)
+    __table_args__ = (db.Index('ix_hours_log_staff_date', 'staff_id', 'date'),)
 
 
 class LeaveRecord(db.Model):
@@ -104,185 +178,399 @@ class Utilization(db.Model):
     client_utilization_month_to_date = db.Column(db.Float, default=0.0)
     resource_utilization_year_to_date = db.Column(db.Float, default=0.0)
     resource_utilization_month_to_date = db.Column(db.Float, default=0.0)
+    __table_args__ = (db.Index('ix_utilization_staff_week', 'staff_id', 'week_start'),)
 
 
-def convert_date(date_str):
-    if isinstance(date_str, str):
-        return datetime.strptime(date_str, '%Y-%m-%d').date()
-    return date_str
+FAKE_DESCRIPTION = "This is a sample description generated during data migration."
 
+# Number of random dates generated up front and cycled through per migration
+FAKE_DATE_POOL_SIZE = 1024
 
-def fake_description():
-    return "This is a sample description generated during data migration."
 
+# Columns read from the old database for the tables converted in Python. The
+# SELECTs name them explicitly so rows can be passed straight through as
+# positional insert parameters, with any generated values appended.
+ENGAGEMENT_KEYS = ('id', 'name', 'team_leader_id', 'status')
+PROPOSAL_KEYS = ('id', 'name', 'team_leader_id', 'status')
+LEAVE_RECORD_KEYS = ('id', 'staff_id', 'date')
 
-def fake_date():
-    return datetime.now().date() + timedelta(days=random.randint(1, 365))
+ENGAGEMENT_SELECT = f"SELECT {', '.join(ENGAGEMENT_KEYS)} FROM engagement"
+PROPOSAL_SELECT = f"SELECT {', '.join(PROPOSAL_KEYS)} FROM proposal"
+LEAVE_RECORD_SELECT = f"SELECT {', '.join(LEAVE_RECORD_KEYS)} FROM leave_record"
+
+# These inserts go straight to the DBAPI, so dates are bound as ISO strings
+ENGAGEMENT_INSERT = (
+    "INSERT INTO engagement (id, name, team_leader_id, status, description, start_date, end_date) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+PROPOSAL_INSERT = (
+    "INSERT INTO proposal (id, name, team_leader_id, status, description, due_date) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+# Only a clash on the (staff_id, date) unique constraint is ignored; a
+# duplicate id still aborts the migration
+LEAVE_RECORD_INSERT = (
+    "INSERT INTO leave_record (id, staff_id, date) "
+    "VALUES (?, ?, ?) "
+    "ON CONFLICT (staff_id, date) DO NOTHING"
+)
+
+
+def fake_date_pool(size=FAKE_DATE_POOL_SIZE):
+    today = datetime.now().date()
+    return [
+        (today + timedelta(days=random.randint(1, 365))).isoformat()
+        for _ in range(size)
+    ]
+
+
+def iter_rows(cursor, sql, size=BATCH_SIZE):
+    """Yield the rows of a query in batches of at most `size` rows
+
+    The next batch is fetched on a worker thread while the caller is still
+    converting and inserting the current one.
+    """
+    cursor.execute(sql)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pending = executor.submit(cursor.fetchmany, size)
+        while True:
+            rows = pending.result()
+            if not rows:
+                break
+            pending = executor.submit(cursor.fetchmany, size)
+            yield rows
+
+
+def transfer_rows(conn, insert_sql, cursor, select_sql, convert):
+    """Stream a query from the old database into `insert_sql` batch by batch
+
+    `convert` turns one batch of source tuples into positional parameters,
+    which are handed to the DBAPI's executemany() without going through
+    SQLAlchemy's statement compilation or type processing. At most one batch
+    of tuples and one batch of parameters is alive at a time. Returns the
+    number of rows inserted.
+    """
+    count = 0
+    for batch in iter_rows(cursor, select_sql):
+        rows = convert(batch)
+        if rows:
+            count += conn.exec_driver_sql(insert_sql, rows).rowcount
+    return count
+
+
+def normalize_date(value):
+    """Return an old-database date as a YYYY-MM-DD string, or None if invalid
+
+    Accepts everything the original strptime('%Y-%m-%d') parsing did, such as
+    unpadded '2024-8-5', plus ISO dates with a time part. Impossible dates
+    like '2024-02-30' and numbers are rejected.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value).date().isoformat()
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+
+def date_expression(name):
+    """SQL normalising the old-database date column `name` to YYYY-MM-DD
+
+    SQLite's date() passes impossible dates through unchanged and reads
+    numbers as Julian days, so its result is only trusted when a round trip
+    through the '+0 days' modifier gives back the same date. Anything else
+    goes through normalize_date(), which yields NULL for an invalid date.
+    """
+    return (
+        f"CASE WHEN typeof({name}) = 'text' "
+        f"AND date({name}, '+0 days') = substr({name}, 1, 10) "
+        f"THEN date({name}) ELSE normalize_date({name}) END"
+    )
+
+
+def source_expression(column):
+    """SQL converting an old-database column to the type of `column`
+
+    Values are assumed to have passed invalid_condition(), so the casts here
+    never have to guess at junk text.
+    """
+    if isinstance(column.type, db.Date):
+        return date_expression(column.name)
+    if isinstance(column.type, db.Float):
+        return f"CAST({column.name} AS REAL)"
+    if isinstance(column.type, db.Boolean):
+        # bool(None) was False, so NULL must not survive as NULL
+        return f"ifnull({column.name}, 0) != 0"
+    return column.name
+
+
+def invalid_condition(column):
+    """SQL that is true for an old-database value `column` cannot hold
+
+    These are the values float() and date parsing rejected when rows were
+    converted in Python; left alone, CAST() would turn text into 0.0 and
+    date() would pass impossible dates through.
+    """
+    if isinstance(column.type, db.Date):
+        return f"{column.name} IS NOT NULL AND ({date_expression(column.name)}) IS NULL"
+    if isinstance(column.type, db.Float):
+        return f"typeof({column.name}) NOT IN ('integer', 'real', 'null')"
+    return None
+
+
+def copy_table(conn, model):
+    """Copy a table with an identical schema from the attached old database
+
+    The old table is checked first, and any value that cannot be converted
+    raises ValueError so the migration fails instead of copying it silently.
+    """
+    table = model.__table__
+    checks = [
+        (column.name, invalid_condition(column))
+        for column in table.columns
+        if invalid_condition(column) is not None
+    ]
+    if checks:
+        counts = conn.exec_driver_sql(
+            f"SELECT {', '.join(f'count(CASE WHEN {condition} THEN 1 END)' for _, condition in checks)} "
+            f"FROM old.{table.name}"
+        ).one()
+        invalid = [f"{name} ({count})" for (name, _), count in zip(checks, counts) if count]
+        if invalid:
+            raise ValueError(f"Invalid values in {table.name}: {', '.join(invalid)}")
+
+    columns = ', '.join(column.name for column in table.columns)
+    expressions = ', '.join(source_expression(column) for column in table.columns)
+    result = conn.exec_driver_sql(
+        f"INSERT INTO {table.name} ({columns}) SELECT {expressions} FROM old.{table.name}"
+    )
+    return result.rowcount
+
+
+@contextmanager
+def attach_database(conn, path, name):
+    """Attach a database file to `conn` for the duration of the block
+
+    SQLite refuses to ATTACH or DETACH inside a transaction, so both run on
+    their own and the block must finish its transaction before exiting.
+    """
+    conn.execute(text(f"ATTACH DATABASE :path AS {name}"), {'path': path})
+    conn.commit()
+    try:
+        yield
+    finally:
+        conn.exec_driver_sql(f"DETACH DATABASE {name}")
+        conn.commit()
 
 
 def transfer_data(old_db_path):
-    logging.info(f"Starting data transfer from {old_db_path}")
+    logging.info("Starting data transfer from %s", old_db_path)
 
     if not os.path.exists(old_db_path):
-        logging.error(f"Old database not found at {old_db_path}")
+        logging.error("Old database not found at %s", old_db_path)
         return False
 
-    # Connect to the old database
-    old_conn = sqlite3.connect(old_db_path)
+    # Connect to the old database. The uploaded file is only ever read, so it
+    # is opened read-only and immutable, which lets SQLite skip file locking
+    # and change detection; isolation_level=None stops sqlite3 wrapping the
+    # reads in implicit transactions.
+    old_conn = sqlite3.connect(
+        f"file:{pathname2url(old_db_path)}?mode=ro&immutable=1",
+        uri=True,
+        isolation_level=None,
+        check_same_thread=False
+    )
     old_cursor = old_conn.cursor()
 
+    # The old database is also attached to the new one so that tables with
+    # identical schemas can be copied without leaving SQLite
+    conn = db.engine.connect()
+
     try:
-        # Start a transaction
-        db.session.begin_nested()
-
-        # Clear existing data from all tables
-        logging.info("Clearing existing data from all tables")
-        NonBillable.query.delete()
-        HoursLog.query.delete()
-        LeaveRecord.query.delete()
-        Utilization.query.delete()
-        Proposal.query.delete()
-        Engagement.query.delete()
-        Staff.query.delete()
-
-        # Transfer Staff data
-        logging.info("Transferring Staff data")
-        old_cursor.execute("SELECT * FROM staff")
-        staff_data = old_cursor.fetchall()
-        for row in staff_data:
-            staff = Staff(
-                id=row[0],
-                name=row[1],
-                email=row[2],
-                leave_days_remaining=float(row[3]),
-                is_team_leader=bool(row[4]),
-                receive_notifications=bool(row[5])
-            )
-            db.session.add(staff)
-        logging.info(f"Transferred {len(staff_data)} Staff records")
-
-        # Commit staff data first and flush the session
-        db.session.flush()
-
-        # Transfer Engagement data
-        logging.info("Transferring Engagement data")
-        old_cursor.execute("SELECT * FROM engagement")
-        engagement_data = old_cursor.fetchall()
-        for row in engagement_data:
-            engagement = Engagement(
-                id=row[0],
-                name=row[1],
-                team_leader_id=row[2],
-                status=row[3],
-                description=fake_description(),
-                start_date=fake_date(),
-                end_date=fake_date()
-            )
-            db.session.add(engagement)
-        logging.info(f"Transferred {len(engagement_data)} Engagement records")
-
-        # Transfer Proposal data
-        logging.info("Transferring Proposal data")
-        old_cursor.execute("SELECT * FROM proposal")
-        proposal_data = old_cursor.fetchall()
-        for row in proposal_data:
-            proposal = Proposal(
-                id=row[0],
-                name=row[1],
-                team_leader_id=row[2],
-                status=row[3],
-                description=fake_description(),
-                due_date=fake_date()
-            )
-            db.session.add(proposal)
-        logging.info(f"Transferred {len(proposal_data)} Proposal records")
-
-        # Transfer NonBillable data
-        logging.info("Transferring NonBillable data")
-        old_cursor.execute("SELECT * FROM non_billable")
-        non_billable_data = old_cursor.fetchall()
-        for row in non_billable_data:
-            non_billable = NonBillable(
-                id=row[0],
-                name=row[1]
-            )
-            db.session.add(non_billable)
-        logging.info(f"Transferred {len(non_billable_data)} NonBillable records")
-
-        # Transfer HoursLog data
-        logging.info("Transferring HoursLog data")
-        old_cursor.execute("SELECT * FROM hours_log")
-        hours_log_data = old_cursor.fetchall()
-        for row in hours_log_data:
-            hours_log = HoursLog(
-                id=row[0],
-                staff_id=row[1],
-                category=row[2],
-                item_id=row[3],
-                hours=float(row[4]),
-                date=convert_date(row[5])
-            )
-            db.session.add(hours_log)
-        logging.info(f"Transferred {len(hours_log_data)} HoursLog records")
-
-        # Transfer LeaveRecord data
-        logging.info("Transferring LeaveRecord data")
-        old_cursor.execute("SELECT * FROM leave_record")
-        leave_record_data = old_cursor.fetchall()
-        leave_records_added = 0
-        for row in leave_record_data:
-            try:
-                leave_record = LeaveRecord(
-                    id=row[0],
-                    staff_id=row[1],
-                    date=convert_date(row[2])
-                )
-                db.session.add(leave_record)
-                leave_records_added += 1
-            except IntegrityError:
-                logging.warning(f"Skipping duplicate leave record for staff {row[1]} on {row[2]}")
-                db.session.rollback()
-                continue
-        logging.info(f"Transferred {leave_records_added} LeaveRecord records")
-
-        # Transfer Utilization data
-        logging.info("Transferring Utilization data")
-        old_cursor.execute("SELECT * FROM utilization")
-        utilization_data = old_cursor.fetchall()
-        for row in utilization_data:
-            utilization = Utilization(
-                id=row[0],
-                staff_id=row[1],
-                week_start=convert_date(row[2]),
-                client_utilization_year_to_date=float(row[3]),
-                client_utilization_month_to_date=float(row[4]),
-                resource_utilization_year_to_date=float(row[5]),
-                resource_utilization_month_to_date=float(row[6])
-            )
-            db.session.add(utilization)
-        logging.info(f"Transferred {len(utilization_data)} Utilization records")
-
-        # Commit all changes
-        db.session.commit()
+        apply_pragmas(old_conn, SQLITE_READ_PRAGMAS)
+        with attach_database(conn, old_db_path, 'old'):
+            # Everything from clearing the tables to the last insert is one
+            # transaction, committed on success and rolled back on any error
+            with conn.begin():
+                transfer_tables(conn, old_cursor)
+
+        # Fold the WAL back into the main file so it can be sent on its own
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
         logging.info("Data transfer completed successfully")
         return True
 
     except sqlite3.OperationalError as e:
-        logging.error(f"SQLite Operational Error: {e}")
-        db.session.rollback()
+        logging.error("SQLite Operational Error: %s", e)
         return False
     except IntegrityError as e:
-        logging.error(f"Integrity Error: {e}")
-        db.session.rollback()
+        logging.error("Integrity Error: %s", e)
         return False
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
-        db.session.rollback()
+        logging.error("An unexpected error occurred: %s", e)
         return False
     finally:
+        conn.close()
         old_conn.close()
 
 
+def transfer_tables(conn, old_cursor):
+    # Clear existing data from all tables, children before parents. An
+    # unqualified DELETE lets SQLite use its truncate optimization.
+    logging.info("Clearing existing data from all tables")
+    for table in reversed(db.metadata.sorted_tables):
+        conn.execute(table.delete())
+
+    # Secondary indexes are dropped for the load and built once at the end,
+    # which is much cheaper than updating them for every inserted row. This
+    # runs after the DELETEs have opened the transaction so it is rolled back
+    # along with everything else on failure.
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    for index in indexes:
+        index.drop(conn, checkfirst=True)
+
+    # Transfer Staff data
+    logging.info("Transferring Staff data")
+    staff_count = copy_table(conn, Staff)
+    logging.info("Transferred %d Staff records", staff_count)
+
+    # Engagement and Proposal dates are drawn from a pool generated once
+    fake_dates = cycle(fake_date_pool())
+
+    def convert_engagements(batch):
+        return [
+            row + (FAKE_DESCRIPTION, next(fake_dates), next(fake_dates))
+            for row in batch
+        ]
+
+    def convert_proposals(batch):
+        return [row + (FAKE_DESCRIPTION, next(fake_dates)) for row in batch]
+
+    # Transfer Engagement data
+    logging.info("Transferring Engagement data")
+    engagement_count = transfer_rows(
+        conn, ENGAGEMENT_INSERT, old_cursor, ENGAGEMENT_SELECT, convert_engagements
+    )
+    logging.info("Transferred %d Engagement records", engagement_count)
+
+    # Transfer Proposal data
+    logging.info("Transferring Proposal data")
+    proposal_count = transfer_rows(
+        conn, PROPOSAL_INSERT, old_cursor, PROPOSAL_SELECT, convert_proposals
+    )
+    logging.info("Transferred %d Proposal records", proposal_count)
+
+    # Transfer NonBillable data
+    logging.info("Transferring NonBillable data")
+    non_billable_count = copy_table(conn, NonBillable)
+    logging.info("Transferred %d NonBillable records", non_billable_count)
+
+    # Transfer HoursLog data
+    logging.info("Transferring HoursLog data")
+    hours_log_count = copy_table(conn, HoursLog)
+    logging.info("Transferred %d HoursLog records", hours_log_count)
+
+    # Transfer LeaveRecord data, dropping duplicates of the (staff_id, date)
+    # unique constraint instead of letting them abort the transaction. Dates
+    # are validated and normalised here, so repeats are filtered on the
+    # normalised date and ON CONFLICT is only a backstop. Nothing else can be
+    # dropped, so every row read but not inserted is a duplicate.
+    seen = set()
+    read_count = 0
+
+    def convert_leave_records(batch):
+        nonlocal read_count
+        read_count += len(batch)
+        rows = []
+        for record_id, staff_id, raw_date in batch:
+            leave_date = normalize_date(raw_date)
+            if leave_date is None:
+                raise ValueError(f"Invalid date in leave_record {record_id}: {raw_date!r}")
+            key = (staff_id, leave_date)
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append((record_id, staff_id, leave_date))
+        return rows
+
+    logging.info("Transferring LeaveRecord data")
+    leave_record_count = transfer_rows(
+        conn, LEAVE_RECORD_INSERT, old_cursor, LEAVE_RECORD_SELECT, convert_leave_records
+    )
+    if read_count > leave_record_count:
+        logging.warning("Skipped %d duplicate leave records", read_count - leave_record_count)
+    logging.info("Transferred %d LeaveRecord records", leave_record_count)
+
+    # Transfer Utilization data
+    logging.info("Transferring Utilization data")
+    utilization_count = copy_table(conn, Utilization)
+    logging.info("Transferred %d Utilization records", utilization_count)
+
+    logging.info("Rebuilding indexes")
+    for index in indexes:
+        index.create(conn)
+
+
+def run_migration(job_id, file_path):
+    """Migrate an uploaded database and snapshot the result for download
+
+    Returns the path of the snapshot, or None if the migration failed.
+    """
+    try:
+        with app.app_context():
+            if not transfer_data(file_path):
+                return None
+
+        # Copy the migrated database with the backup API so later migrations
+        # cannot change the file while it is being downloaded
+        result_path = os.path.join(app.config['RESULT_FOLDER'], f'{job_id}.db')
+        source = sqlite3.connect(os.path.join(basedir, 'new_database.db'))
+        target = sqlite3.connect(result_path)
+        try:
+            source.backup(target)
+            # The live database runs in WAL mode, which the backup copies
+            # into the file header; hand out a plain rollback-journal file
+            # that needs no -wal/-shm side files
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+            source.close()
+        return result_path
+    except Exception:
+        logging.exception("Migration job %s failed", job_id)
+        return None
+    finally:
+        # The upload is only needed for the migration itself
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+
+def expire_jobs():
+    """Forget jobs that finished more than RESULT_TTL seconds ago
+
+    Result files are expired by modification time rather than through jobs,
+    so snapshots left behind by an earlier run of the app are removed too.
+    """
+    cutoff = time.time() - RESULT_TTL
+    for job_id, job in list(jobs.items()):
+        if job['finished'] is not None and job['finished'] < cutoff:
+            jobs.pop(job_id, None)
+
+    for name in os.listdir(app.config['RESULT_FOLDER']):
+        path = os.path.join(app.config['RESULT_FOLDER'], name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
 @app.route('/', methods=['GET', 'POST'])
 def upload_file():
     if request.method == 'POST':
@@ -292,23 +580,54 @@ def upload_file():
         if file.filename == '':
             return 'No selected file'
         if file:
-            filename = secure_filename(file.filename)
+            expire_jobs()
+            job_id = uuid.uuid4().hex
+            filename = f'{job_id}_{secure_filename(file.filename)}'
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-
-            success = transfer_data(file_path)
-
-            if success:
-                return send_file(
-                    os.path.join(basedir, 'new_database.db'),
-                    as_attachment=True,
-                    download_name='new_database.db'
-                )
-            else:
-                return 'Error occurred during data transfer'
+            with open(file_path, 'wb') as f:
+                shutil.copyfileobj(file.stream, f, length=UPLOAD_COPY_BUFFER_SIZE)
+
+            future = migration_executor.submit(run_migration, job_id, file_path)
+            job = {'future': future, 'finished': None}
+            future.add_done_callback(lambda future: job.update(finished=time.time()))
+            jobs[job_id] = job
+            logging.info("Queued migration job %s", job_id)
+
+            # Browsers get a page that polls for the result and starts the
+            # download when it is ready; API clients get the job as JSON
+            result_url = url_for('get_result', job_id=job_id)
+            headers = {'Location': result_url}
+            if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+                return jsonify(job_id=job_id, result_url=result_url), 202, headers
+            return render_template('migration_status.html', result_url=result_url), 202, headers
     return render_template('upload.html')
 
 
+@app.route('/result/<job_id>')
+def get_result(job_id):
+    expire_jobs()
+    job = jobs.get(job_id)
+    if job is None:
+        return 'Unknown job', 404
+    future = job['future']
+    if not future.done():
+        return 'Migration in progress', 202
+
+    result_path = future.result()
+    if result_path is None:
+        return 'Error occurred during data transfer', 500
+    if not os.path.exists(result_path):
+        return 'Result expired', 404
+    return send_file(
+        result_path,
+        as_attachment=True,
+        download_name='new_database.db',
+        conditional=True,
+        etag=True,
+        max_age=0
+    )
+
+
 def create_database():
     """Create the new database and all tables"""
     with app.app_context():
@@ -320,5 +639,11 @@ if __name__ == '__main__':
     # Create the database and tables
     create_database()
 
-    # Run the Flask application
-    app.run(debug=True)
\ No newline at end of file
+    # Serve the Flask application with a multi-threaded production WSGI server
+    from waitress import serve
+    serve(
+        app,
+        host=os.environ.get('HOST', '127.0.0.1'),
+        port=int(os.environ.get('PORT', 5000)),
+        threads=8
+    )